@@ -1,25 +1,27 @@
 import streamlit as st
 import pandas as pd
 import sqlite3
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 import plotly.express as px
 import os
+from pathlib import Path
 import requests
+import shutil
+import threading
 import time
+from contextlib import closing
+from concurrent.futures import Future, ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # --- Database Download Function ---
 @st.cache_data
 def download_database():
-    """Download database from external URL if not exists locally"""
+    """Download database from external URL unless the local copy is current, resuming partial downloads"""
     db_path = 'e_commerce.db'
+    part_path = db_path + '.part'
+    etag_path = db_path + '.etag'
     status_placeholder = st.empty()
-    # Check if database already exists
-    if os.path.exists(db_path):
-        status_placeholder.info(" Database found locally!")
-        time.sleep(2)
-        status_placeholder.empty()
-        return db_path
-    
+
     # Get database URL from secrets or environment
     db_url = None
     try:
@@ -30,44 +32,143 @@ def download_database():
         except:
             pass
     
+    # ETag of the complete database, or of the partial download while one is in progress
+    stored_etag = None
+    if os.path.exists(etag_path):
+        with open(etag_path) as f:
+            stored_etag = f.read().strip() or None
+
+    # Check if a complete database already exists and is still current
+    if os.path.exists(db_path) and not os.path.exists(part_path):
+        remote_etag = None
+        if db_url and stored_etag:
+            try:
+                head = requests.head(db_url, allow_redirects=True, timeout=10)
+                head.raise_for_status()
+                remote_etag = head.headers.get('ETag')
+            except requests.RequestException:
+                remote_etag = None
+        # Keep the local copy unless the remote reports a different version
+        if remote_etag is None or remote_etag == stored_etag:
+            status_placeholder.info(" Database found locally!")
+            time.sleep(2)
+            status_placeholder.empty()
+            return db_path
+
     try:
         status_placeholder.info(" Downloading database... This may take a moment.")
         time.sleep(2)
         status_placeholder.empty()
         
-        # Download with progress
-        response = requests.get(db_url, stream=True)
-        response.raise_for_status()
-        
-        total_size = int(response.headers.get('content-length', 0))
-        
-        with open(db_path, 'wb') as f:
-            if total_size > 0:
-                downloaded = 0
-                progress_bar = st.progress(0)
-                
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        progress = min(downloaded / total_size, 1.0)
-                        progress_bar.progress(progress)
-                        
-                progress_bar.empty()
-            else:
-                f.write(response.content)
-        
-        # Verify file was created and has content
-        if os.path.exists(db_path) and os.path.getsize(db_path) > 0:
-            status_placeholder.success(" Database downloaded successfully!")
-            time.sleep(2)
-            status_placeholder.empty()
-            return db_path
+        # Size the finished .part must have before it may replace the local copy, when known
+        expected_size = None
+
+        # A local SQLite source (plain path or file:// URL) is copied with the online backup API
+        source_path = db_url[len('file://'):] if db_url and db_url.startswith('file://') else db_url
+        if source_path and os.path.isfile(source_path):
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            if os.path.exists(etag_path):
+                os.remove(etag_path)
+            progress_bar = st.progress(0)
+            source_uri = Path(source_path).resolve().as_uri() + '?mode=ro'
+            with closing(sqlite3.connect(source_uri, uri=True)) as src, closing(sqlite3.connect(part_path)) as dst:
+                src.backup(dst, pages=1024,
+                           progress=lambda status, remaining, total: progress_bar.progress(1 - remaining / total))
+            progress_bar.empty()
         else:
+            # Resume a partial download only if the remote file is unchanged (If-Range)
+            # Ask for the uncompressed body so byte ranges line up with the file on disk
+            resume_from = 0
+            headers = {'Accept-Encoding': 'identity'}
+            if os.path.exists(part_path) and stored_etag:
+                resume_from = os.path.getsize(part_path)
+                headers.update({'Range': f'bytes={resume_from}-', 'If-Range': stored_etag})
+
+            # Download with progress
+            response = requests.get(db_url, stream=True, headers=headers)
+            # A 416 "bytes */<size>" matching the .part means it already holds the whole file
+            # (e.g. a crash before the rename below), so it only needs renaming
+            remote_size = response.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+            part_complete = (response.status_code == 416 and remote_size.isdigit()
+                             and int(remote_size) == resume_from)
+            if part_complete:
+                expected_size = resume_from
+                response.close()
+            else:
+                if response.status_code == 416:
+                    # Nothing left to fetch from that offset; start over
+                    resume_from = 0
+                    response = requests.get(db_url, stream=True, headers={'Accept-Encoding': 'identity'})
+                response.raise_for_status()
+                if response.status_code != 206:
+                    resume_from = 0
+
+                etag = response.headers.get('ETag')
+                if etag:
+                    with open(etag_path, 'w') as f:
+                        f.write(etag)
+                elif os.path.exists(etag_path):
+                    os.remove(etag_path)
+
+                total_size = resume_from + int(response.headers.get('content-length', 0))
+                if response.status_code == 206:
+                    # "bytes N-M/<total>" gives the full file size of a resumed download
+                    remote_size = response.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+                    expected_size = int(remote_size) if remote_size.isdigit() else None
+                elif 'content-length' in response.headers:
+                    expected_size = total_size
+                # Undo any gzip/deflate transfer encoding while reading the raw stream
+                response.raw.decode_content = True
+
+                def save_response():
+                    with open(part_path, 'ab' if resume_from else 'wb') as f:
+                        shutil.copyfileobj(response.raw, f, length=1 << 20)
+
+                # Copy on a worker thread in 1 MB blocks; poll the file size for coarse progress
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    copy_job = executor.submit(save_response)
+                    if total_size > 0:
+                        progress_bar = st.progress(0)
+                        last_pct = 0
+                        while not copy_job.done():
+                            time.sleep(0.25)
+                            downloaded = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                            pct = min(int(100 * downloaded / total_size), 100)
+                            if pct != last_pct:
+                                progress_bar.progress(pct)
+                                last_pct = pct
+                        progress_bar.empty()
+                    copy_job.result()
+
+        # Verify the download has content before it replaces the local copy
+        if not os.path.exists(part_path) or os.path.getsize(part_path) == 0:
+            if os.path.exists(db_path) and os.path.getsize(db_path) > 0:
+                st.warning("Database update failed - using the existing local copy")
+                return db_path
             st.error("❌ Database download failed - file is empty or missing")
             return None
+        # A truncated file must not be marked current by the stored ETag; keep the .part to resume
+        downloaded_size = os.path.getsize(part_path)
+        if expected_size is not None and downloaded_size != expected_size:
+            raise IOError(f"incomplete download ({downloaded_size:,} of {expected_size:,} bytes)")
+
+        # Swap in the complete file and drop WAL files left over from the previous copy
+        os.replace(part_path, db_path)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        
+        status_placeholder.success(" Database downloaded successfully!")
+        time.sleep(2)
+        status_placeholder.empty()
+        return db_path
         
     except Exception as e:
+        # Keep serving a complete local copy; the .part/.etag files stay so the next start can resume
+        if os.path.exists(db_path) and os.path.getsize(db_path) > 0:
+            st.warning(f"Database update failed ({e}) - using the existing local copy")
+            return db_path
         st.error(f"❌ Failed to download database: {e}")
         st.info("Please check your DATABASE_URL and internet connection")
         return None
@@ -84,94 +185,258 @@ if not db_path or not os.path.exists(db_path):
     st.error("❌ Database not available. Cannot proceed.")
     st.stop()
 
+# --- Database Preparation ---
+@st.cache_resource
+def prepare_database(database_path):
+    """Add an integer order date (YYYYMMDD) and the indexes used by the dashboard queries"""
+    try:
+        conn = sqlite3.connect(database_path)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(orders)")]
+        if 'order_created_date' not in columns:
+            conn.execute("ALTER TABLE orders ADD COLUMN order_created_date INTEGER")
+        # Always backfill missing values, so a backfill interrupted on an earlier start is completed
+        conn.execute("""
+            UPDATE orders
+            SET order_created_date = order_created_year * 10000
+                + order_created_month * 100
+                + order_created_day
+            WHERE order_created_date IS NULL
+              AND order_created_year IS NOT NULL
+        """)
+        conn.commit()
+        conn.executescript("""
+            CREATE INDEX IF NOT EXISTS idx_orders_created_date ON orders(order_created_date);
+            CREATE INDEX IF NOT EXISTS idx_orders_moment_collected ON orders(order_moment_collected);
+            CREATE INDEX IF NOT EXISTS idx_orders_store ON orders(store_id);
+            CREATE INDEX IF NOT EXISTS idx_orders_status_date ON orders(order_status, order_created_date);
+            CREATE INDEX IF NOT EXISTS idx_stores_hub ON stores(hub_id);
+            CREATE INDEX IF NOT EXISTS idx_deliv_order ON deliveries(delivery_order_id);
+            CREATE INDEX IF NOT EXISTS idx_deliv_driver ON deliveries(driver_id);
+            ANALYZE;
+            PRAGMA journal_mode=WAL;
+        """)
+        conn.commit()
+        conn.close()
+        return database_path
+    except Exception as e:
+        st.error(f"Database preparation failed: {e}")
+        st.stop()
+
+prepare_database(db_path)
+
 # --- Database Connection ---
+def open_db_connection(database_path):
+    """Open a read-only tuned connection: 256 MB page cache and a memory-mapped file"""
+    conn = sqlite3.connect(f"file:{database_path}", uri=True, check_same_thread=False)
+    conn.executescript("""
+        PRAGMA synchronous=NORMAL;
+        PRAGMA cache_size=-262144;
+        PRAGMA mmap_size=1073741824;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA query_only=1;
+    """)
+    return conn
+
 @st.cache_resource
-def get_db_connection(database_path):
-    """Create database connection with caching"""
+def get_query_pool(database_path):
+    """Create a thread pool whose workers each keep their own database connection"""
     try:
-        conn = sqlite3.connect(database_path, check_same_thread=False)
-        return conn
+        # Fail early and visibly if the database cannot be opened
+        open_db_connection(database_path).close()
     except Exception as e:
         st.error(f"Database connection failed: {e}")
         st.stop()
+    # Workers open their connection lazily (see run_query) so a failure is reported per query
+    # instead of breaking the cached pool for the life of the process
+    return ThreadPoolExecutor(max_workers=4), threading.local()
+
+query_pool, query_worker = get_query_pool(db_path)
+script_ctx = get_script_run_ctx()
 
-conn = get_db_connection(db_path)
+def submit_query(loader, *args):
+    """Run a cached loader on the query pool, attached to this session's script context"""
+    def run():
+        add_script_run_ctx(threading.current_thread(), script_ctx)
+        return loader(*args)
+    try:
+        return query_pool.submit(run)
+    except Exception as e:
+        # Hand the error to the section that collects this job
+        failed_job = Future()
+        failed_job.set_exception(e)
+        return failed_job
+
+def run_query(sql, params=()):
+    """Run a query on the calling worker's connection and build a DataFrame from the rows"""
+    if getattr(query_worker, 'conn', None) is None:
+        query_worker.conn = open_db_connection(db_path)
+    # sqlite3 keeps compiled statements per connection, so identical SQL text skips re-parsing
+    cursor = query_worker.conn.execute(sql, params)
+    columns = [col[0] for col in cursor.description]
+    df = pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+    # Counts and ids fit in narrower ints; floats stay float64 so amounts and averages keep their cents
+    for col in df.select_dtypes('int64').columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+# --- CSV Export ---
+@st.cache_data
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """Encode a DataFrame as CSV bytes, reused while the data is unchanged"""
+    return df.to_csv(index=False).encode("utf-8")
+
+# --- Table Display ---
+TABLE_PAGE_SIZE = 1000
+
+def show_table(df, key):
+    """Show one page of a table so only the visible rows are sent to the browser"""
+    page_count = max((len(df) + TABLE_PAGE_SIZE - 1) // TABLE_PAGE_SIZE, 1)
+    page = 1
+    if page_count > 1:
+        # The widget key keeps the page index in st.session_state across reruns
+        page = st.number_input(f"Page (1-{page_count})", min_value=1, max_value=page_count, key=f"{key}_page")
+    start = (page - 1) * TABLE_PAGE_SIZE
+    st.dataframe(df.iloc[start:start + TABLE_PAGE_SIZE], use_container_width=True)
+    if page_count > 1:
+        st.caption(f"Rows {start + 1:,}-{min(start + TABLE_PAGE_SIZE, len(df)):,} of {len(df):,}; download the CSV for the full table")
 
 # --- Sidebar Filters ---
 with st.sidebar:
     st.markdown("###  Date Filter")
     start_date = st.date_input("Start Date", date(2021, 1, 1))
     end_date = st.date_input("End Date", date(2021, 4, 30))
-    
+
 # ----------------------
-# 1. ORDERS BY HUB/CITY
+# QUERIES
 # ----------------------
 
-st.header(" Orders by City & Hub")
+# Small dimension lookup: store -> hub/city, joined to the per-store facts in pandas
+query_hub_dims = """
+SELECT
+    s.store_id,
+    h.hub_city AS city,
+    h.hub_name AS hub
+FROM stores s
+JOIN hubs h ON s.hub_id = h.hub_id;
+"""
 
-# SQLite compatible query
+@st.cache_resource(show_spinner=False)
+def load_hub_dims():
+    """Load the store to hub/city lookup once per process"""
+    dims = run_query(query_hub_dims)
+    # Categorical keys let the per-hub groupby work on integer codes instead of hashing strings
+    dims['city'] = dims['city'].astype('category')
+    dims['hub'] = dims['hub'].astype('category')
+    return dims
+
+def sum_by_hub(store_df):
+    """Attach city/hub to per-store totals and sum them per hub"""
+    return (
+        load_hub_dims()
+        .merge(store_df, on='store_id')
+        .drop(columns='store_id')
+        .groupby(['city', 'hub'], as_index=False, observed=True)
+        .sum()
+    )
+
+# SQLite compatible query (orders table only, grouped per store)
 query_orders = """
 SELECT 
-    h.hub_city AS city,
-    h.hub_name AS hub,
-    COUNT(CASE WHEN o.order_status = 'FINISHED' THEN 1 END) AS total_orders,
-    COUNT(CASE WHEN o.order_status = 'CANCELED' THEN 1 END) AS cancelled_orders,
-    ROUND(
-        100.0 * COUNT(CASE WHEN o.order_status = 'CANCELED' THEN 1 END) 
-        / NULLIF(COUNT(*), 0), 2
-    ) AS cancelled_percent
-FROM orders o
-JOIN stores s ON o.store_id = s.store_id
-JOIN hubs h ON s.hub_id = h.hub_id
-WHERE DATE(
-    o.order_created_year || '-' ||
-    PRINTF('%02d', o.order_created_month) || '-' ||
-    PRINTF('%02d', o.order_created_day)
-) BETWEEN ? AND ?
-GROUP BY h.hub_city, h.hub_name
-ORDER BY h.hub_city;
+    store_id,
+    COUNT(CASE WHEN order_status = 'FINISHED' THEN 1 END) AS total_orders,
+    COUNT(CASE WHEN order_status = 'CANCELED' THEN 1 END) AS cancelled_orders,
+    COUNT(*) AS all_orders
+FROM orders
+WHERE order_created_date BETWEEN ? AND ?
+GROUP BY store_id;
 """
 
-try:
-    # Convert dates to strings for SQLite
-    start_date_str = start_date.strftime('%Y-%m-%d')
-    end_date_str = end_date.strftime('%Y-%m-%d')
-    df_orders = pd.read_sql_query(query_orders, conn, params=[start_date_str, end_date_str])   
-except Exception as e:
-    st.error(f"Error executing orders query: {e}")
-    df_orders = pd.DataFrame()
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_orders(start_date, end_date):
+    """Load orders by city & hub for the date range, cached across reruns"""
+    # Convert dates to YYYYMMDD integers to match order_created_date
+    start_date_int = int(start_date.strftime('%Y%m%d'))
+    end_date_int = int(end_date.strftime('%Y%m%d'))
+    store_orders = run_query(query_orders, (start_date_int, end_date_int))
+    df = sum_by_hub(store_orders)
+    df['cancelled_percent'] = (100.0 * df['cancelled_orders'] / df['all_orders']).round(2)
+    return df.drop(columns='all_orders')
 
-# KPI Cards for Orders
-kpi_query1 = """ 
+query_driver = """
 SELECT 
-  COUNT(CASE WHEN order_status = 'FINISHED' THEN 1 END ) AS total_orders,
-  COUNT(CASE WHEN order_status = 'CANCELED' THEN 1 END) AS cancelled_orders,
+  d.driver_id,
+  COUNT(o.order_id) AS total_deliveries,
+  ROUND(AVG(d.delivery_distance_meters), 2) AS avg_delivery_distance,
+  SUM(CASE WHEN d.delivery_status <> 'DELIVERED' THEN 1 ELSE 0 END) AS delivery_failure_count,
   ROUND(
-    100.0 * COUNT(CASE WHEN order_status = 'CANCELED' THEN 1 END) 
-    / NULLIF(COUNT(order_id), 0), 2
-  ) AS cancelled_percent
+    100.0 * AVG(CASE WHEN d.delivery_status <> 'DELIVERED' THEN 1.0 ELSE 0.0 END), 2
+  ) AS delivery_fail_rate_percent,
+  ROUND(
+    AVG((julianday(o.order_moment_delivered) - julianday(o.order_moment_collected)) * 1440), 2
+  ) AS avg_delivery_time_mins
+FROM deliveries d
+JOIN orders o ON o.order_id = d.delivery_order_id
+JOIN drivers dr ON d.driver_id = dr.driver_id
+WHERE o.order_moment_collected IS NOT NULL AND o.order_moment_delivered IS NOT NULL
+AND julianday(o.order_moment_collected) IS NOT NULL AND julianday(o.order_moment_delivered) IS NOT NULL
+AND o.order_status = 'FINISHED'
+AND o.order_moment_collected >= ? AND o.order_moment_collected < ?
+GROUP BY d.driver_id
+ORDER BY d.driver_id;
+"""
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_driver_metrics(start_date, end_date):
+    """Load per-driver metrics aggregated in SQLite for the date range, cached across reruns"""
+    # Half-open range on the raw timestamp so idx_orders_moment_collected is used
+    start_date_str = start_date.strftime('%Y-%m-%d')
+    end_date_str = (end_date + timedelta(days=1)).strftime('%Y-%m-%d')
+    return run_query(query_driver, (start_date_str, end_date_str))
+
+revenue_query = """
+SELECT
+  store_id,
+  COUNT(order_id) AS total_orders,
+  SUM(order_amount) AS total_revenue
 FROM orders
-WHERE DATE(
-    order_created_year || '-' ||
-    PRINTF('%02d', order_created_month) || '-' ||
-    PRINTF('%02d', order_created_day)
-) BETWEEN ? AND ?
+WHERE order_status = 'FINISHED'
+AND order_created_date BETWEEN ? AND ?
+GROUP BY store_id;
 """
 
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_revenue(start_date, end_date):
+    """Load revenue by city & hub for the date range, cached across reruns"""
+    start_date_int = int(start_date.strftime('%Y%m%d'))
+    end_date_int = int(end_date.strftime('%Y%m%d'))
+    store_revenue = run_query(revenue_query, (start_date_int, end_date_int))
+    df = sum_by_hub(store_revenue)
+    df['avg_payment_amount'] = (df['total_revenue'] / df['total_orders']).round(2)
+    return df
+
+# Run the independent queries concurrently; each section below collects its result
+orders_job = submit_query(load_orders, start_date, end_date)
+driver_job = submit_query(load_driver_metrics, start_date, end_date)
+revenue_job = submit_query(load_revenue, start_date, end_date)
+
+# ----------------------
+# 1. ORDERS BY HUB/CITY
+# ----------------------
+
+st.header(" Orders by City & Hub")
+
 try:
-    start_date_str = start_date.strftime('%Y-%m-%d')
-    end_date_str = end_date.strftime('%Y-%m-%d')
-    kpi_df1 = pd.read_sql_query(kpi_query1, conn, params=[start_date_str, end_date_str])
-    if not kpi_df1.empty:
-        total_orders = int(kpi_df1['total_orders'].iloc[0]) if kpi_df1['total_orders'].iloc[0] else 0
-        cancelled_orders = int(kpi_df1['cancelled_orders'].iloc[0]) if kpi_df1['cancelled_orders'].iloc[0] else 0
-        cancelled_percent = f"{kpi_df1['cancelled_percent'].iloc[0]}%" if kpi_df1['cancelled_percent'].iloc[0] else "0%"
-    else:
-        total_orders = 0
-        cancelled_orders = 0
-        cancelled_percent = "0%"
+    df_orders = orders_job.result()
 except Exception as e:
-    st.error(f"Error executing KPI query: {e}")
+    st.error(f"Error executing orders query: {e}")
+    df_orders = pd.DataFrame()
+
+# KPI Cards for Orders (column totals of the hub breakdown above)
+if not df_orders.empty:
+    total_orders = int(df_orders['total_orders'].sum())
+    cancelled_orders = int(df_orders['cancelled_orders'].sum())
+    cancelled_percent = f"{100 * cancelled_orders / max(total_orders + cancelled_orders, 1):.2f}%"
+else:
     total_orders = 0
     cancelled_orders = 0
     cancelled_percent = "0%"
@@ -182,9 +447,9 @@ col2.metric(" Cancelled Orders", f"{cancelled_orders:,}")
 col3.metric(" Cancellation Rate", cancelled_percent)
 
 if not df_orders.empty:
-    st.dataframe(df_orders, use_container_width=True)
+    show_table(df_orders, 'orders')
     # Download Orders CSV
-    csv_orders = df_orders.to_csv(index=False).encode("utf-8")
+    csv_orders = to_csv_bytes(df_orders)
     st.download_button("Download Orders CSV", csv_orders, "order_metrics.csv", "text/csv")
 else:
     st.warning("No order data for selected filters.")
@@ -194,43 +459,12 @@ else:
 # -------------------------------------
 st.header("Driver Performance Metrics")
 
-query_driver = """
-SELECT 
-  o.order_id,
-  d.driver_id,
-  d.delivery_distance_meters,
-  d.delivery_status,
-  o.order_moment_collected,
-  o.order_moment_delivered
-FROM deliveries d
-JOIN orders o ON o.order_id = d.delivery_order_id
-JOIN drivers dr ON d.driver_id = dr.driver_id
-WHERE o.order_moment_collected IS NOT NULL AND o.order_moment_delivered IS NOT NULL
-AND o.order_status = 'FINISHED'
-"""
-
 try:
-    df = pd.read_sql_query(query_driver, conn)
-    # Convert timestamps
-    df['collected_dt'] = pd.to_datetime(df['order_moment_collected'], errors='coerce')
-    df['delivered_dt'] = pd.to_datetime(df['order_moment_delivered'], errors='coerce')
-
-    df = df.dropna(subset=['collected_dt', 'delivered_dt'])
-    df = df[(df['collected_dt'].dt.date >= start_date) & (df['collected_dt'].dt.date <= end_date)]
-
-    df['delivery_time_mins'] = (df['delivered_dt'] - df['collected_dt']).dt.total_seconds() / 60
-
-    driver_metrics = df.groupby(['driver_id']).agg(
-        total_deliveries=('order_id', 'count'),
-        avg_delivery_distance=('delivery_distance_meters', 'mean'),
-        delivery_failure_count=('delivery_status', lambda x: (x != 'DELIVERED').sum()),
-        delivery_fail_rate_percent=('delivery_status', lambda x: (x != 'DELIVERED').mean() * 100),
-        avg_delivery_time_mins=('delivery_time_mins', 'mean')
-    ).round(2).reset_index()
+    driver_metrics = driver_job.result()
 
     if not driver_metrics.empty:
-        st.dataframe(driver_metrics, use_container_width=True)
-        csv_driver = driver_metrics.to_csv(index=False).encode("utf-8")
+        show_table(driver_metrics, 'drivers')
+        csv_driver = to_csv_bytes(driver_metrics)
         st.download_button("Download Driver Metrics CSV", csv_driver, "driver_metrics.csv", "text/csv")
     else:
         st.warning("No driver data available for selected date range.")
@@ -244,64 +478,18 @@ except Exception as e:
 
 st.header("Revenue by City & Hub")
 
-revenue_query = """
-SELECT
-  h.hub_city AS city,
-  h.hub_name AS hub,
-  COUNT(o.order_id) AS total_orders,
-  SUM(o.order_amount) AS total_revenue,
-  ROUND(AVG(o.order_amount), 2) AS avg_payment_amount
-FROM orders o 
-JOIN stores s ON o.store_id = s.store_id
-JOIN hubs h ON s.hub_id = h.hub_id
-WHERE o.order_status = 'FINISHED'
-AND DATE(
-    o.order_created_year || '-' ||
-    PRINTF('%02d', o.order_created_month) || '-' ||
-    PRINTF('%02d', o.order_created_day)
-) BETWEEN ? AND ?
-GROUP BY h.hub_city, h.hub_name
-ORDER BY h.hub_city;
-"""
-
 try:
-    start_date_str = start_date.strftime('%Y-%m-%d')
-    end_date_str = end_date.strftime('%Y-%m-%d')
-    revenue_df = pd.read_sql_query(revenue_query, conn, params=[start_date_str, end_date_str])
+    revenue_df = revenue_job.result()
 except Exception as e:
     st.error(f"Error executing revenue query: {e}")
     revenue_df = pd.DataFrame()
     
-# KPI Summary for Revenue
-kpi_query2 = """
-SELECT
-  COUNT(DISTINCT order_id) AS total_orders,
-  SUM(order_amount) AS total_revenue,
-  ROUND(AVG(order_amount), 2) AS avg_order_value
-FROM orders 
-WHERE order_status = 'FINISHED'
-  AND DATE(
-    order_created_year || '-' ||
-    PRINTF('%02d', order_created_month) || '-' ||
-    PRINTF('%02d', order_created_day)
-) BETWEEN ? AND ?;
-"""
-
-try:
-    start_date_str = start_date.strftime('%Y-%m-%d')
-    end_date_str = end_date.strftime('%Y-%m-%d')
-    
-    kpi_df2 = pd.read_sql_query(kpi_query2, conn, params=[start_date_str, end_date_str])
-    if not kpi_df2.empty:
-        total_orders_rev = int(kpi_df2['total_orders'].iloc[0]) if kpi_df2['total_orders'].iloc[0] else 0
-        total_revenue = float(kpi_df2['total_revenue'].iloc[0]) if kpi_df2['total_revenue'].iloc[0] else 0.0
-        avg_order_value = float(kpi_df2['avg_order_value'].iloc[0]) if kpi_df2['avg_order_value'].iloc[0] else 0.0
-    else:
-        total_orders_rev = 0
-        total_revenue = 0.0
-        avg_order_value = 0.0
-except Exception as e:
-    st.error(f"Error executing revenue KPI query: {e}")
+# KPI Summary for Revenue (column totals of the hub breakdown above)
+if not revenue_df.empty:
+    total_orders_rev = int(revenue_df['total_orders'].sum())
+    total_revenue = float(revenue_df['total_revenue'].sum())
+    avg_order_value = round(total_revenue / max(total_orders_rev, 1), 2)
+else:
     total_orders_rev = 0
     total_revenue = 0.0
     avg_order_value = 0.0
@@ -311,13 +499,11 @@ col1.metric("Total Revenue", f"${total_revenue:,.2f}")
 col2.metric("Total Orders", f"{total_orders_rev:,}")
 col3.metric("Avg Order Value", f"${avg_order_value:,.2f}")
 
-# Revenue Table & Chart
-if not revenue_df.empty:
-    st.dataframe(revenue_df, use_container_width=True)
-
-    st.subheader("Total Revenue by City and Hub")
+@st.cache_data
+def build_revenue_fig(df):
+    """Build the revenue bar chart, reused while the revenue table is unchanged"""
     fig = px.bar(
-        revenue_df,
+        df,
         x="hub",
         y="total_revenue",
         color="city",
@@ -329,9 +515,17 @@ if not revenue_df.empty:
         yaxis_title="Total Revenue ($)",
         showlegend=True
     )
+    return fig
+
+# Revenue Table & Chart
+if not revenue_df.empty:
+    show_table(revenue_df, 'revenue')
+
+    st.subheader("Total Revenue by City and Hub")
+    fig = build_revenue_fig(revenue_df)
     st.plotly_chart(fig, use_container_width=True)
 
-    csv_revenue = revenue_df.to_csv(index=False).encode("utf-8")
+    csv_revenue = to_csv_bytes(revenue_df)
     st.download_button("Download Revenue CSV", csv_revenue, "revenue_metrics.csv", "text/csv")
 else:
     st.warning("No revenue data available for selected date range.")